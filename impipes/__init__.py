@@ -9,3 +9,7 @@ __version__ = '0.1.8'
 
 from . import filters
 from . import pipes
+from . import dedup
+from . import watch
+from . import memory
+from . import report
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+Runs the impipes command with python -m impipes.
+
+@author: Rodolfo Ferro
+"""
+
+from .cli import main
+
+main()
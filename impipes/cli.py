@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line batch runner for pipelines described in YAML or JSON specs.
+
+A spec lists the filters and, optionally, the run settings:
+
+    filters:
+      - Dehaze
+      - name: Gamma
+        params: {gamma: 1.8}
+      - name: Kernel
+        params: {kernel: [[1, 1, 1], [1, 20, 1], [1, 1, 1]]}
+    inputs: ["photos/**/*.jpg"]
+    output: modified
+    format: jpg
+    workers: 4
+    memory: 2048
+
+The memory budget is given in MB, as with --memory. Settings given on the
+command line override those of the spec. With --profile the images are
+processed by a single worker, since cProfile only sees the thread it runs
+in.
+
+@author: Rodolfo Ferro
+"""
+
+import argparse
+import cProfile
+import glob
+import json
+import os.path
+import pstats
+import sys
+from .pipes import Pipeline
+from .report import printProgress
+
+
+def loadSpec(path):
+    """Reads a pipeline spec from a JSON or YAML file. YAML needs PyYAML.
+
+    Parameters
+    ----------
+    path : str
+            The path to a .json, .yml or .yaml file.
+
+    Returns
+    -------
+    dict
+            The spec.
+    """
+
+    with open(path) as stream:
+        if path.split('.')[-1] in ('yml', 'yaml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is needed to read YAML specs, "
+                                  "install it with pip install pyyaml")
+            return yaml.safe_load(stream)
+        return json.load(stream)
+
+
+def parseArguments(argv=None):
+    """Parses the arguments of the impipes command."""
+
+    parser = argparse.ArgumentParser(
+        prog='impipes',
+        description='Applies a pipeline of filters to a batch of images.')
+    parser.add_argument('spec', help='pipeline spec (.json, .yml or .yaml)')
+    parser.add_argument('-i', '--input', action='append', dest='inputs',
+                        metavar='GLOB',
+                        help='input files, folders or glob patterns; '
+                             'may be repeated')
+    parser.add_argument('-o', '--output', help='output folder')
+    parser.add_argument('-f', '--format', choices=('jpg', 'jpeg', 'png',
+                                                   'tif'),
+                        help='output file type')
+    parser.add_argument('-q', '--quality', type=int,
+                        help='JPEG quality from 0 to 100')
+    parser.add_argument('--compression', type=int,
+                        help='PNG compression level from 0 to 9')
+    parser.add_argument('--prefix', help='prefix of output file names')
+    parser.add_argument('--sufix', help='sufix of output file names')
+    parser.add_argument('-w', '--workers', type=int,
+                        help='images processed in parallel')
+    parser.add_argument('--tile', type=int,
+                        help='process images in tiles of this size')
+    parser.add_argument('--overlap', type=int,
+                        help='margin around tiles in pixels')
+    parser.add_argument('--memory', type=float, metavar='MB',
+                        help='memory budget of the run in MB')
+    parser.add_argument('--cache', metavar='FOLDER',
+                        help='reuse results stored in this folder')
+    parser.add_argument('--deduplicate', action='store_true', default=None,
+                        help='process duplicated inputs only once')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='store counters and failures of the run in '
+                             'FILE, as JSON if it ends with .json and in '
+                             'the Prometheus text format otherwise')
+    parser.add_argument('--quiet', action='store_true',
+                        help='do not print progress')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='store cProfile statistics of the run in FILE; '
+                             'images are processed by a single worker')
+
+    return parser.parse_args(argv)
+
+
+def findInputs(patterns):
+    """Expands input folders and glob patterns to a list of image files.
+
+    Parameters
+    ----------
+    patterns : list
+            A list of paths to folders or files, or glob patterns.
+
+    Returns
+    -------
+    list
+            A sorted list of paths without repetitions.
+    """
+
+    images = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*')
+        for path in glob.glob(pattern, recursive=True):
+            if path.split('.')[-1] in ('jpg', 'jpeg', 'png', 'tif'):
+                images.add(path)
+
+    return sorted(images)
+
+
+def main(argv=None):
+    """Entry point of the impipes command."""
+
+    arguments = parseArguments(argv)
+    spec = loadSpec(arguments.spec)
+    settings = dict(spec)
+    for name in ('inputs', 'output', 'format', 'quality', 'compression',
+                 'prefix', 'sufix', 'workers', 'tile', 'overlap', 'memory',
+                 'cache', 'deduplicate'):
+        value = getattr(arguments, name)
+        if value is not None:
+            settings[name] = value
+
+    inputs = settings.get('inputs', [])
+    # In YAML a single pattern is easily written without brackets.
+    if isinstance(inputs, str):
+        inputs = [inputs]
+
+    pipeline = Pipeline.fromSpec(settings)
+    for image in findInputs(inputs):
+        pipeline.addImage(image)
+    if not pipeline.images:
+        sys.exit("No input images found")
+    if not pipeline.outputPath:
+        pipeline.setOutputPath('modified')
+    if not arguments.quiet:
+        pipeline.setProgress(printProgress)
+
+    if arguments.profile:
+        # cProfile only records the calling thread, so worker threads would
+        # be missing from the statistics.
+        pipeline.setWorkers(1)
+        profile = cProfile.Profile()
+        profile.runcall(pipeline.run)
+        profile.dump_stats(arguments.profile)
+        pstats.Stats(profile, stream=sys.stderr) \
+            .sort_stats('cumulative').print_stats(15)
+    else:
+        pipeline.run()
+
+    if arguments.metrics:
+        pipeline.report.save(arguments.metrics)
+    for path, reason in pipeline.report.failures:
+        sys.stderr.write('{}: {}\n'.format(path, reason))
+    if pipeline.report.failures:
+        sys.exit(1)
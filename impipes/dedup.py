@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Duplicate and near-duplicate detection of input images.
+
+@author: Rodolfo Ferro
+"""
+
+import hashlib
+import os.path
+import cv2
+
+
+def fileHash(path, blockSize=1 << 20):
+    """Computes a hash of the raw bytes of a file.
+
+    Parameters
+    ----------
+    path : str
+            The path to an image file like r"~/path/to/my/image.jpg"
+    blockSize : int (optional)
+            Number of bytes read at once. By default it is 1 MiB.
+
+    Returns
+    -------
+    str
+            Hexadecimal SHA-1 digest of the file contents.
+    """
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as stream:
+        block = stream.read(blockSize)
+        while block:
+            digest.update(block)
+            block = stream.read(blockSize)
+
+    return digest.hexdigest()
+
+
+def perceptualHash(path, hashSize=8):
+    """Computes a difference hash (dHash) of an image. The image is decoded
+    at 1/8 of its resolution which, for JPEG files, skips most of the
+    decoding work.
+
+    Parameters
+    ----------
+    path : str
+            The path to an image file like r"~/path/to/my/image.jpg"
+    hashSize : int (optional)
+            Side of the hash grid; the hash has hashSize ** 2 bits.
+            By default it is set to 8.
+
+    Returns
+    -------
+    int or None
+            The hash packed in an integer, or None if the file could not
+            be decoded.
+    """
+
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+
+    small = cv2.resize(image, (hashSize + 1, hashSize),
+                       interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+
+    return value
+
+
+def hammingDistance(first, second):
+    """Number of differing bits between two perceptual hashes.
+
+    Parameters
+    ----------
+    first : int
+            A hash returned by perceptualHash().
+    second : int
+            A hash returned by perceptualHash().
+
+    Returns
+    -------
+    int
+            The Hamming distance between both hashes.
+    """
+
+    return bin(first ^ second).count('1')
+
+
+def findDuplicates(paths, perceptual=False, maxDistance=4):
+    """Groups image files holding the same picture. Files are first grouped
+    by size and only files sharing a size are hashed, so unique inputs cost
+    a single stat call. If perceptual is True, byte-unique files are further
+    grouped by their perceptual hash.
+
+    Parameters
+    ----------
+    paths : list
+            A list of paths to image files.
+    perceptual : bool (optional)
+            If True near-duplicates (re-encoded or resized copies) are
+            grouped as well. Default is False.
+    maxDistance : int (optional)
+            Maximum Hamming distance between perceptual hashes of two
+            images considered near-duplicates. By default it is set to 4.
+            The hashes are split in maxDistance + 1 bands and only images
+            sharing a band are compared, so larger values compare more
+            pairs and get slower.
+
+    Returns
+    -------
+    list
+            A list of groups (lists of paths) in input order. The first
+            path of each group is the one to be processed. Files that
+            cannot be read are left in groups of their own, so that the
+            error is reported when they are processed.
+    """
+
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            sizes.append(None)
+    counts = {}
+    for size in sizes:
+        counts[size] = counts.get(size, 0) + 1
+
+    groups = []
+    byKey = {}
+    for path, size in zip(paths, sizes):
+        key = (size, path)
+        if size is not None and counts[size] > 1:
+            try:
+                key = (size, fileHash(path))
+            except OSError:
+                pass
+        if key in byKey:
+            byKey[key].append(path)
+        else:
+            byKey[key] = [path]
+            groups.append(byKey[key])
+
+    if not perceptual:
+        return groups
+
+    # Two 64 bit hashes at most maxDistance bits apart are equal on at
+    # least one of maxDistance + 1 bands, so only images sharing a band
+    # value need to be compared.
+    bands = min(maxDistance + 1, 64)
+    edges = [64 * band // bands for band in range(bands + 1)]
+
+    def bandKeys(value):
+        return [(band, (value >> edges[band]) &
+                 ((1 << (edges[band + 1] - edges[band])) - 1))
+                for band in range(bands)]
+
+    merged = []
+    hashes = []
+    buckets = {}
+    for group in groups:
+        value = perceptualHash(group[0])
+        if value is None:
+            merged.append(group)
+            hashes.append(None)
+            continue
+
+        keys = bandKeys(value)
+        candidates = set()
+        for key in keys:
+            candidates.update(buckets.get(key, ()))
+        for index in sorted(candidates):
+            if hammingDistance(value, hashes[index]) <= maxDistance:
+                merged[index].extend(group)
+                break
+        else:
+            for key in keys:
+                buckets.setdefault(key, []).append(len(merged))
+            merged.append(group)
+            hashes.append(value)
+
+    return merged
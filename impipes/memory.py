@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Memory estimation and admission control for pipeline runs.
+
+@author: Rodolfo Ferro
+"""
+
+import struct
+import threading
+import cv2
+
+
+def imageShape(path):
+    """Reads the height and width of an image file. PNG, JPEG and TIFF
+    headers are parsed directly; other files are decoded at 1/8 of their
+    resolution.
+
+    Parameters
+    ----------
+    path : str
+            The path to an image file like r"~/path/to/my/image.jpg"
+
+    Returns
+    -------
+    tuple
+            Height and width of the image in pixels, or None if the file
+            could not be read.
+    """
+
+    try:
+        with open(path, 'rb') as stream:
+            head = stream.read(26)
+            if head[:8] == b'\x89PNG\r\n\x1a\n':
+                width, height = struct.unpack('>II', head[16:24])
+                return height, width
+            if head[:2] == b'\xff\xd8':
+                return _jpegShape(stream)
+            if head[:4] in (b'II*\x00', b'MM\x00*'):
+                return _tiffShape(stream, '<' if head[:2] == b'II' else '>')
+    except (IOError, struct.error):
+        return None
+
+    image = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    return image.shape[0] * 8, image.shape[1] * 8
+
+
+def _jpegShape(stream):
+    """Finds the frame header of a JPEG stream. Called from imageShape()."""
+
+    stream.seek(2)
+    while True:
+        marker = stream.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        if marker[1] == 0xff:
+            stream.seek(-1, 1)
+            continue
+        length, = struct.unpack('>H', stream.read(2))
+        if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', stream.read(5))
+            return height, width
+        stream.seek(length - 2, 1)
+
+
+def _tiffShape(stream, order):
+    """Reads the size of the first image of a TIFF stream. Called from
+    imageShape()."""
+
+    stream.seek(4)
+    offset, = struct.unpack(order + 'I', stream.read(4))
+    stream.seek(offset)
+    count, = struct.unpack(order + 'H', stream.read(2))
+    size = {}
+    for _ in range(count):
+        tag, kind, _, value = struct.unpack(order + 'HHI4s', stream.read(12))
+        if tag in (256, 257):
+            size[tag], = struct.unpack(order + ('H2x' if kind == 3 else 'I'),
+                                       value)
+    if 256 in size and 257 in size:
+        return size[257], size[256]
+    return None
+
+
+class MemoryBudget(object):
+    """Admits work while the memory it is estimated to use fits a budget.
+
+    Parameters
+    ----------
+    budget : int
+            Number of bytes that may be in use at once.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, size):
+        """Waits until size bytes fit in the budget and reserves them.
+        Requests larger than the whole budget wait until nothing else is
+        running.
+
+        Parameters
+        ----------
+        size : int
+                Number of bytes to reserve.
+
+        Returns
+        -------
+        int
+                The number of bytes reserved, to be given to release().
+        """
+
+        size = min(size, self.budget)
+        with self.condition:
+            while self.used + size > self.budget:
+                self.condition.wait()
+            self.used += size
+            self.peak = max(self.peak, self.used)
+
+        return size
+
+    def release(self, size):
+        """Returns bytes reserved with acquire() to the budget.
+
+        Parameters
+        ----------
+        size : int
+                The number of bytes returned by acquire().
+        """
+
+        with self.condition:
+            self.used -= size
+            self.condition.notify_all()
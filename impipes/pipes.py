@@ -5,9 +5,21 @@ Created on Mon Jun 10 13:54:03 2019
 @author: Cristian Vargas, Lukasz Kaczmarek, and Rodolfo Ferro
 """
 
+import asyncio
+import collections
+import hashlib
+import json
 import os
 import os.path
+import tempfile
+import time
+import warnings
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from .filters import *
+from .dedup import fileHash, findDuplicates
+from .memory import MemoryBudget, imageShape
+from .report import Report
 import matplotlib.pyplot as plt
 import numpy
 import wget
@@ -25,6 +37,27 @@ class Pipeline(object):
         self.outputFIleType = 'jpg'
         self.sufix = "_modified"
         self.prefix = ""
+        self.quality = None
+        self.compression = None
+        self.deduplicate = False
+        self.perceptual = False
+        self.maxDistance = 4
+        self.dedupReport = {}
+        self.workers = 1
+        self.tileSize = 0
+        self.tileOverlap = 32
+        self.cachePath = ''
+        self.cacheKey = ''
+        self.memoryBudget = 0
+        self.memoryReport = {}
+        self.progress = None
+        self.progressInterval = 1.0
+        self.report = Report()
+        self.executor = None
+        self.concurrency = 0
+        # Limit and semaphore of aprocess() for each event loop, since a
+        # semaphore can only be awaited from one loop.
+        self._semaphores = weakref.WeakKeyDictionary()
 
     def setSufix(self, sufix):
         """Sets sufix to be added at the end of file names while storing.
@@ -60,17 +93,33 @@ class Pipeline(object):
         ----------
         fileType : str
                 A str describing type of output format ("jpg", "jpeg",
-                "png" or "tif").
+                "png" or "tif"). Other values raise ValueError.
         """
 
-        if fileType in ('jpg', 'jpeg', 'png', 'tif'):
-            self.outputFIleType = fileType
-        else:
-            print("File type must be jpg, jpeg, png or tif")
+        if fileType not in ('jpg', 'jpeg', 'png', 'tif'):
+            raise ValueError("File type must be jpg, jpeg, png or tif")
+        self.outputFIleType = fileType
+
+    def setOutputQuality(self, quality=None, compression=None):
+        """Sets encoding settings of modified images.
+
+        Parameters
+        ----------
+        quality : int
+                JPEG quality from 0 to 100. Default is None, the OpenCV
+                default (95).
+        compression : int
+                PNG compression level from 0 to 9. Default is None, the
+                OpenCV default (1).
+        """
+
+        self.quality = quality
+        self.compression = compression
 
     def setOutputPath(self, path):
         """Sets path to a folder in which modifed images will be stored.
-        If the folder does not exist it will be created.
+        If the folder does not exist it will be created; OSError is raised
+        if it cannot be.
 
         Parameters
         ----------
@@ -78,12 +127,202 @@ class Pipeline(object):
                 The path to the output folder like r"~/path/to/output/folder"
         """
 
+        if not os.path.isdir(path):
+            os.makedirs(path)
         self.outputPath = path
-        if not os.path.isdir(self.outputPath):
-            try:
-                os.mkdir(self.outputPath)
-            except IOError as error:
-                print(error)
+
+    def setDeduplicate(self, deduplicate=True, perceptual=False,
+                       maxDistance=4):
+        """Enables detection of duplicated input images. Each unique image
+        is processed once and the result is stored under the file name of
+        every one of its copies.
+
+        Parameters
+        ----------
+        deduplicate : bool
+                If True duplicated inputs are processed only once.
+                Default is True.
+        perceptual : bool
+                If True near-duplicates (re-encoded or resized copies) are
+                detected with a perceptual hash as well. Default is False.
+        maxDistance : int
+                Maximum Hamming distance between perceptual hashes of two
+                images considered near-duplicates. Default is 4.
+        """
+
+        self.deduplicate = deduplicate
+        self.perceptual = perceptual
+        self.maxDistance = maxDistance
+
+    def setWorkers(self, workers=1):
+        """Sets the number of images processed in parallel by run(). All
+        worker threads share the filters of the pipeline. Pipelines with
+        stateful filters (see isStateful()) use a single worker.
+
+        Parameters
+        ----------
+        workers : int
+                Number of worker threads. Default is 1.
+        """
+
+        if type(workers) is int and workers > 0:
+            self.workers = workers
+
+    def setTiling(self, tileSize=0, overlap=32):
+        """Processes images larger than tileSize in square tiles to bound
+        the memory used by the filters. Tiles are enlarged by overlap pixels
+        on each side and only their centers are kept, which hides seams of
+        filters reaching no further than overlap pixels from each pixel.
+        The default covers the kernels, Denoise and Unsharp with their
+        default parameters. Pipelines that are not tileable (see
+        isTileable()) are never tiled, and a warning is issued: CLAHE lays
+        its grid over the whole image, Dehaze estimates the atmospheric
+        light from the whole image and refines the transmission over 50
+        pixels, and stateful filters would take every tile as a new image
+        of the sequence.
+
+        Parameters
+        ----------
+        tileSize : int
+                Side of the tiles in pixels. 0 disables tiling.
+                Default is 0.
+        overlap : int
+                Margin in pixels added around each tile. Default is 32.
+        """
+
+        if tileSize and not self.isTileable():
+            warnings.warn("The filters of the pipeline cannot be tiled, "
+                          "images are processed whole", stacklevel=2)
+        self.tileSize = tileSize
+        self.tileOverlap = overlap
+
+    def setMemoryBudget(self, budget=0):
+        """Limits the memory run() may use at once. Before an image is
+        processed its peak memory is estimated with estimateMemory() and it
+        waits until it fits the budget next to the images in progress.
+        Images that would not fit alone are processed in tiles small enough
+        to fit if the pipeline can be tiled (see isTileable()); otherwise
+        they run alone, with the whole budget. The estimate covers image
+        arrays only, not the interpreter or libraries, so leave some margin.
+
+        Parameters
+        ----------
+        budget : int
+                Number of bytes. 0 means no limit. Default is 0.
+        """
+
+        self.memoryBudget = budget
+
+    def estimateMemory(self, image, tileSize=0):
+        """Estimates the peak memory needed to process an image, from its
+        size and the working set declared by each filter.
+
+        Parameters
+        ----------
+        image : str, tuple or numpy.ndarray
+                The path to an image file, its (height, width) or the
+                image itself.
+        tileSize : int
+                Side of the tiles if the image is processed in tiles.
+                Default is 0, no tiles.
+
+        Return
+        ----------
+        int
+                Estimated number of bytes, or 0 if the size of the image
+                is unknown.
+        """
+
+        if isinstance(image, str):
+            image = imageShape(image)
+        elif isinstance(image, numpy.ndarray):
+            image = image.shape
+        if image is None:
+            return 0
+
+        height, width = image[:2]
+        # Images are decoded as 8 bit BGR.
+        size = height * width * 3
+        if not tileSize or (height <= tileSize and width <= tileSize):
+            return int(size * (1 + self._workingSet((height, width))))
+
+        side = tileSize + 2 * self.tileOverlap
+        shape = (min(side, height), min(side, width))
+        tile = shape[0] * shape[1] * 3
+        return int(2 * size + tile * self._workingSet(shape))
+
+    def _workingSet(self, shape):
+        """Returns the largest working set of the filters on an image of
+        the given shape. Called from estimateMemory()."""
+
+        return max([item.workingSetFor(shape) for item in self.pipeline] or
+                   [0])
+
+    def _fitTile(self, shape):
+        """Returns the largest tile size, a multiple of 16 and at least
+        64, whose estimate fits the memory budget."""
+
+        tileSize = max(shape[:2])
+        while tileSize > 64 and \
+                self.estimateMemory(shape, tileSize) > self.memoryBudget:
+            tileSize = max(64, (tileSize // 2 + 15) // 16 * 16)
+
+        return tileSize
+
+    def setProgress(self, callback=None, interval=1.0):
+        """Sets a function called with the Report of run() to follow its
+        progress, like report.printProgress.
+
+        Parameters
+        ----------
+        callback : callable
+                A function taking a report.Report. Default is None.
+        interval : float
+                Minimum number of seconds between two calls. The function
+                is called once more at the end of the run. Default is 1.0.
+        """
+
+        self.progress = callback
+        self.progressInterval = interval
+
+    def setExecutor(self, executor=None, concurrency=0):
+        """Sets where the asynchronous methods aprocess() and aiterate()
+        run the filters, so the event loop is never blocked by them.
+
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor
+                An executor like ThreadPoolExecutor(4). Default is None,
+                the default executor of the event loop.
+        concurrency : int
+                Maximum number of images processed at once by aprocess().
+                Further calls wait for a free slot. 0 means no limit.
+                Default is 0.
+        """
+
+        self.executor = executor
+        self.concurrency = concurrency
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def setCache(self, path, key=''):
+        """Stores processed images in a cache folder so that run() skips
+        inputs already processed with the same filters. Entries are keyed by
+        the contents of the input file and by key.
+
+        Parameters
+        ----------
+        path : str
+                The path to the cache folder. If the folder does not exist
+                it will be created. An empty str disables the cache.
+        key : str
+                A str identifying the filters and their parameters. By
+                default fingerprint() is used.
+        """
+
+        self.cachePath = path
+        self.cacheKey = key
+        if path and not os.path.isdir(path):
+            os.makedirs(path)
 
     def addImage(self, imagePath):
         """Adds a raw image file to be proccessed to the pipeline.
@@ -138,7 +377,99 @@ class Pipeline(object):
 
         self.pipeline = pipeline
 
-    def saveModified(self, image, fileName):
+    def toSpec(self):
+        """Describes the filters and settings of the pipeline with plain
+        Python objects, which can be stored as JSON or YAML. Images added
+        to the pipeline are not part of the spec.
+
+        Return
+        ----------
+        dict
+                The spec of the pipeline. See fromSpec().
+        """
+
+        spec = {
+            'filters': [item.toSpec() for item in self.pipeline],
+            'format': self.outputFIleType,
+            'prefix': self.prefix,
+            'sufix': self.sufix,
+            'quality': self.quality,
+            'compression': self.compression,
+            'workers': self.workers,
+            'tile': self.tileSize,
+            'overlap': self.tileOverlap,
+            'memory': self.memoryBudget / 2 ** 20,
+            'deduplicate': self.deduplicate
+        }
+        if self.outputPath:
+            spec['output'] = self.outputPath
+        if self.cachePath:
+            spec['cache'] = self.cachePath
+
+        return spec
+
+    @classmethod
+    def fromSpec(cls, spec):
+        """Creates a pipeline from a spec made by toSpec() or read from a
+        JSON or YAML file. Only "filters" is required; a filter may be given
+        by its name alone.
+
+        Parameters
+        ----------
+        spec : dict
+                A dict with the list "filters" of filter specs and,
+                optionally, the settings "output", "format", "prefix",
+                "sufix", "quality", "compression", "workers", "tile",
+                "overlap", "memory", "deduplicate" and "cache". The
+                memory budget is given in MB.
+
+        Return
+        ----------
+        Pipeline
+                A new pipeline.
+        """
+
+        pipeline = cls([Filter.fromSpec(item)
+                        for item in spec.get('filters', [])])
+        if spec.get('output'):
+            pipeline.setOutputPath(spec['output'])
+        pipeline.setOutputFileType(spec.get('format', 'jpg'))
+        pipeline.setPrefix(spec.get('prefix', ''))
+        pipeline.setSufix(spec.get('sufix', '_modified'))
+        pipeline.setOutputQuality(spec.get('quality'), spec.get('compression'))
+        pipeline.setWorkers(spec.get('workers', 1))
+        pipeline.setTiling(spec.get('tile', 0), spec.get('overlap', 32))
+        pipeline.setMemoryBudget(int(spec.get('memory', 0) * 2 ** 20))
+        pipeline.setDeduplicate(bool(spec.get('deduplicate', False)))
+        if spec.get('cache'):
+            pipeline.setCache(spec['cache'])
+
+        return pipeline
+
+    def fingerprint(self):
+        """Hashes the sequence of filters and their parameters. Two
+        pipelines with the same fingerprint produce the same images.
+        Settings such as the output path are not part of the hash.
+
+        Return
+        ----------
+        str
+                Hexadecimal SHA-1 digest of the canonical JSON of the
+                filter specs.
+        """
+
+        def plain(value):
+            if isinstance(value, (numpy.ndarray, numpy.generic)):
+                return value.tolist()
+            raise TypeError(repr(value) + " is not serializable")
+
+        canonical = json.dumps([item.toSpec() for item in self.pipeline],
+                               sort_keys=True, separators=(',', ':'),
+                               default=plain)
+
+        return hashlib.sha1(canonical.encode()).hexdigest()
+
+    def saveModified(self, image, fileName=None, sink=None):
         """Stores a modifed image in a file.
 
         Parameters
@@ -147,16 +478,62 @@ class Pipeline(object):
                 A NumPy's array containing an image.
         fileName : str
                 Name of the image file.
+        sink : file-like object
+                If given the encoded image is written to sink (any object
+                with a write() method, like io.BytesIO or a socket file)
+                instead of the output folder. Default is None.
+                ValueError is raised if neither fileName nor sink is given.
         """
 
+        if sink is not None:
+            sink.write(self.encode(image))
+            return
+        if fileName is None:
+            raise ValueError("A file name or a sink is required")
+
         filename = ''.join(fileName.split('.')[:-1])
         to_join_with = \
             self.prefix + filename + self.sufix + "." + self.outputFIleType
         outputPath = os.path.join(self.outputPath, to_join_with)
-        try:
-            cv2.imwrite(outputPath, image)
-        except IOError as error:
-            print(error)
+        if not cv2.imwrite(outputPath, image,
+                           self._encodeParams(self.outputFIleType)):
+            raise IOError("Image file could not be written: " + outputPath)
+
+    def encode(self, image, fileType=None):
+        """Encodes a modified image in memory according to settings made
+        with setOutputFileType() and setOutputQuality().
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+                A NumPy's array containing an image.
+        fileType : str
+                Overrides the output file type ("jpg", "jpeg", "png" or
+                "tif"). Default is None.
+
+        Return
+        ----------
+        bytes
+                The encoded image.
+        """
+
+        fileType = fileType or self.outputFIleType
+        success, encoded = cv2.imencode('.' + fileType, image,
+                                        self._encodeParams(fileType))
+        if not success:
+            raise IOError("Image could not be encoded as " + fileType)
+
+        return encoded.tobytes()
+
+    def _encodeParams(self, fileType):
+        """Returns the OpenCV encoding parameters for a file type."""
+
+        if fileType in ('jpg', 'jpeg') and self.quality is not None:
+            return [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        if fileType == 'png' and self.compression is not None:
+            return [cv2.IMWRITE_PNG_COMPRESSION, int(self.compression)]
+
+        return []
 
     def show(self, image):
         """Displays an image.
@@ -174,6 +551,188 @@ class Pipeline(object):
         """Applies a seqence of filters/image processes defined with add() or
         setPipeline() to an image.
 
+        Parameters
+        ----------
+        image : numpy.ndarray, str, bytes or file-like object
+                A NumPy's array containing an image, the path to an image
+                file, the encoded contents of an image file or a file-like
+                object to read them from.
+        display_steps : bool
+                If True image is displayed after each filter/image process
+                is applied. Default is False.
+
+        Return
+        ----------
+        numpy.ndarray
+                A NumPy's array containing the modified image.
+        """
+
+        return self._processLoaded(self._load(image), self.tileSize,
+                                   display_steps=display_steps)
+
+    def isStateful(self):
+        """Tells whether a filter of the pipeline carries state from one
+        image to the next, like Dehaze(sequence=True). Such pipelines
+        process one image at a time, in order: run() and aiterate() do not
+        run images in parallel, aprocess() calls run one after the other,
+        and images are not tiled.
+
+        Return
+        ----------
+        bool
+                True if any filter is stateful.
+        """
+
+        return any(item.stateful for item in self.pipeline)
+
+    def isTileable(self):
+        """Tells whether images may be processed in tiles (see setTiling()).
+        Pipelines with stateful filters, or with filters using statistics
+        of the whole image like CLAHE or Dehaze, may not.
+
+        Return
+        ----------
+        bool
+                True if every filter is tileable.
+        """
+
+        return not self.isStateful() and \
+            all(item.tileable for item in self.pipeline)
+
+    def _processLoaded(self, image, tileSize, display_steps=False):
+        """Applies the filters to a loaded image, in tiles of tileSize if
+        it is larger and the pipeline is tileable. Called from process() and
+        run()."""
+
+        height, width = image.shape[:2]
+        if tileSize and not display_steps and self.isTileable() and \
+                (height > tileSize or width > tileSize):
+            return self._processTiled(image, tileSize)
+
+        return self._applyFilters(image, display_steps=display_steps)
+
+    def _load(self, image):
+        """Returns the image given to process() as a NumPy's array.
+
+        Parameters
+        ----------
+        image : numpy.ndarray, str, bytes or file-like object
+                A NumPy's array containing an image, the path to an image
+                file, the encoded contents of an image file (bytes,
+                bytearray or memoryview) or an object with a read() method
+                returning them, like an open file or io.BytesIO.
+
+        Return
+        ----------
+        numpy.ndarray
+                A NumPy's array containing the image. IOError is raised if
+                the image cannot be read or decoded.
+        """
+
+        if isinstance(image, numpy.ndarray):
+            return image
+        if hasattr(image, 'read'):
+            image = image.read()
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            temp = cv2.imdecode(numpy.frombuffer(image, numpy.uint8),
+                                cv2.IMREAD_COLOR)
+            if temp is None:
+                raise IOError("Image data could not be decoded")
+            return temp
+
+        # cv2.imread returns None instead of raising on missing or
+        # unreadable files.
+        temp = cv2.imread(image)
+        if temp is None:
+            raise IOError("Image file could not be read: " + str(image))
+        return temp
+
+    async def aprocess(self, image, encode=False):
+        """Asynchronous version of process(). Decoding, filters and
+        encoding run in the executor set with setExecutor(), at most as many
+        images at once as its concurrency allows, or one at a time, in call
+        order, if the pipeline is stateful.
+
+        Parameters
+        ----------
+        image : numpy.ndarray, str, bytes or file-like object
+                An image as accepted by process().
+        encode : bool
+                If True the modified image is returned encoded with
+                encode(). Default is False.
+
+        Return
+        ----------
+        numpy.ndarray or bytes
+                A NumPy's array containing the modified image, or the
+                encoded image.
+        """
+
+        def work():
+            temp = self.process(image)
+            return self.encode(temp) if encode else temp
+
+        loop = asyncio.get_running_loop()
+        concurrency = 1 if self.isStateful() else self.concurrency
+        if not concurrency:
+            return await loop.run_in_executor(self.executor, work)
+
+        limit, semaphore = self._semaphores.get(loop, (0, None))
+        if limit != concurrency:
+            semaphore = asyncio.Semaphore(concurrency)
+            self._semaphores[loop] = (concurrency, semaphore)
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, work)
+
+    async def aiterate(self, inputs, limit=4):
+        """Processes images from an iterable or an asynchronous iterable
+        and yields the modified images in input order. At most limit images
+        are in progress (one if the pipeline is stateful); the next input is
+        only taken when a result has been consumed, so a slow consumer slows
+        down the producer.
+
+        Parameters
+        ----------
+        inputs : iterable or asynchronous iterable
+                Images as accepted by process().
+        limit : int
+                Maximum number of images in progress. Default is 4.
+
+        Yields
+        ----------
+        numpy.ndarray
+                A NumPy's array containing a modified image.
+        """
+
+        if self.isStateful():
+            limit = 1
+        pending = collections.deque()
+        try:
+            async for image in _asyncIterate(inputs):
+                pending.append(asyncio.ensure_future(self.aprocess(image)))
+                if len(pending) >= limit:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def __getstate__(self):
+        # Executors and semaphores belong to the current process and loops.
+        state = dict(vars(self))
+        state['executor'] = None
+        del state['_semaphores']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _applyFilters(self, image, display_steps=False):
+        """Applies the filters to an already loaded image. Called from
+        process().
+
         Parameters
         ----------
         image : numpy.ndarray
@@ -188,26 +747,102 @@ class Pipeline(object):
                 A NumPy's array containing the modified image.
         """
 
-        if isinstance(image, str):
-            try:
-                temp = cv2.imread(image)
-            except IOError as error:
-                print(error)
-        elif isinstance(image, numpy.ndarray):
-            temp = image
-
+        temp = image
         for item in self.pipeline:
             if display_steps:
                 self.show(temp)
 
-            item.setImage(temp)
-            temp = item.run()
+            temp = item.process(temp)
 
         if display_steps:
             self.show(temp)
 
         return temp
 
+    def _processTiled(self, image, size):
+        """Applies the filters tile by tile (see setTiling()).
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+                A NumPy's array containing an image.
+        size : int
+                Side of the tiles in pixels.
+
+        Return
+        ----------
+        numpy.ndarray
+                A NumPy's array containing the modified image.
+        """
+
+        height, width = image.shape[:2]
+        overlap = self.tileOverlap
+        output = None
+        for top in range(0, height, size):
+            for left in range(0, width, size):
+                bottom = min(top + size, height)
+                right = min(left + size, width)
+                y0, x0 = max(top - overlap, 0), max(left - overlap, 0)
+                y1 = min(bottom + overlap, height)
+                x1 = min(right + overlap, width)
+                tile = self._applyFilters(image[y0:y1, x0:x1])
+                if output is None:
+                    output = numpy.empty((height, width) + tile.shape[2:],
+                                         tile.dtype)
+                output[top:bottom, left:right] = \
+                    tile[top - y0:bottom - y0, left - x0:right - x0]
+
+        return output
+
+    def _runGroup(self, group, save_files, display_steps, tileSize, report):
+        """Processes the first image of a group of copies, in tiles of
+        tileSize if needed, and stores the result for every copy. Cache hits
+        are counted in report. Called from run().
+        """
+
+        image = group[0]
+        temp = None
+        if self.cachePath:
+            key = '{}:{}:{}:{}'.format(self.cacheKey or self.fingerprint(),
+                                       tileSize, self.tileOverlap,
+                                       fileHash(image))
+            cached = os.path.join(self.cachePath,
+                                  hashlib.sha1(key.encode()).hexdigest() +
+                                  '.png')
+            if os.path.isfile(cached):
+                temp = cv2.imread(cached)
+                if temp is not None:
+                    report.count('cached')
+
+        if temp is None:
+            temp = self._processLoaded(self._load(image), tileSize,
+                                       display_steps=display_steps)
+            if self.cachePath:
+                self._storeCached(cached, temp)
+
+        if save_files:
+            for duplicate in group:
+                fileName = os.path.split(duplicate)[1]
+                self.saveModified(temp, fileName)
+
+        return temp
+
+    def _storeCached(self, cached, image):
+        """Writes a cache entry through a temporary file replaced
+        atomically, so other workers never read a partial entry. IOError is
+        raised if the image cannot be written. Called from _runGroup()."""
+
+        descriptor, temporary = tempfile.mkstemp(suffix='.png',
+                                                 dir=self.cachePath)
+        os.close(descriptor)
+        try:
+            if not cv2.imwrite(temporary, image):
+                raise IOError("Cache file could not be written: " + cached)
+            os.replace(temporary, cached)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
     def run(self, save_files=True, display_steps=False, return_list=False):
         """Applies a seqence of filters/image processes defined with add() or
         setPipeline() to images defined with addImage() or addInputFolder().
@@ -229,27 +864,167 @@ class Pipeline(object):
         Return
         ----------
         list
-                A list of NumPy's arrays containing modified images or
+                A list of NumPy's arrays containing modified images, with
+                None for images that could not be processed, or empty list.
+                Counts, timings and failures of the run are kept in
+                self.report (a report.Report).
+        """
+        if self.deduplicate:
+            groups = findDuplicates(self.images, perceptual=self.perceptual,
+                                    maxDistance=self.maxDistance)
+        else:
+            groups = [[image] for image in self.images]
+
+        number = len(groups)
+        results = {}
+        report = Report(len(self.images), self.progress,
+                        self.progressInterval)
+        self.report = report
+        budget = MemoryBudget(self.memoryBudget) \
+            if self.memoryBudget else None
+        tiled = []
+
+        def admit(group):
+            # Waits until the image fits the memory budget and returns the
+            # tile size to use and the number of bytes reserved.
+            if budget is None:
+                return self.tileSize, 0
+            shape = imageShape(group[0])
+            if shape is None:
+                return self.tileSize, 0
+            tileSize = self.tileSize
+            size = self.estimateMemory(shape, tileSize)
+            if size > self.memoryBudget and self.isTileable():
+                tileSize = self._fitTile(shape)
+                size = self.estimateMemory(shape, tileSize)
+                tiled.append(group[0])
+                report.count('tiled')
+            return tileSize, budget.acquire(size)
+
+        def task(group, tileSize, reserved):
+            started = time.time()
+            try:
+                temp = self._runGroup(group, save_files, display_steps,
+                                      tileSize, report)
+            except Exception as error:
+                for duplicate in group:
+                    report.failed(duplicate, error)
+                return
+            finally:
+                if reserved:
+                    budget.release(reserved)
+
+            report.succeeded(group[0], time.time() - started)
+            if len(group) > 1:
+                report.count('skipped', len(group) - 1)
+            if return_list:
+                for duplicate in group:
+                    results[duplicate] = temp
+
+        if self.workers > 1 and not display_steps and \
+                not self.isStateful():
+            with ThreadPoolExecutor(self.workers) as executor:
+                futures = [executor.submit(task, group, *admit(group))
+                           for group in groups]
+                for future in futures:
+                    future.result()
+        else:
+            for group in groups:
+                task(group, *admit(group))
+
+        if budget is not None:
+            self.memoryReport = {'budget': self.memoryBudget,
+                                 'peak': budget.peak, 'tiled': tiled}
+
+        self.dedupReport = {
+            'images': len(self.images),
+            'processed': number,
+            'skipped': len(self.images) - number,
+            'duplicates': [group for group in groups if len(group) > 1]
+        }
+        report.finish()
+
+        return [results.get(image) for image in self.images] \
+            if return_list else []
+
+    def processVideo(self, videoPath, save_files=True, return_list=False):
+        """Applies the filters to every frame of a video file, in order.
+        Filters keeping state between frames, like Dehaze(sequence=True),
+        are reset before the first frame. Frames are stored as images named
+        after the video file and the frame number, e.g. clip_000001.jpg
+        before adding the prefix and sufix.
+
+        Parameters
+        ----------
+        videoPath : str
+                The path to a video file readable by cv2.VideoCapture.
+        save_files : bool
+                If True modified frames are saved in a folder set with
+                setOutputPath(). Default is True.
+        return_list : bool
+                If True the method returns a list of modified frames.
+                Default is False.
+
+        Return
+        ----------
+        list
+                A list of NumPy's arrays containing modified frames or
                 empty list.
         """
-        number = len(self.images)
-        current = 0
-        modified = []
-        for image in self.images:
-            current += 1
-            print("Processing image ", current, "out of", number, "\n", image)
-            temp = self.process(image, display_steps=display_steps)
 
-            if save_files:
-                fileName = os.path.split(image)[1]
-                self.saveModified(temp, fileName)
+        for item in self.pipeline:
+            item.reset()
 
+        name = ''.join(os.path.split(videoPath)[1].split('.')[:-1])
+        modified = []
+        for number, frame in enumerate(readFrames(videoPath), 1):
+            temp = self.process(frame)
+            if save_files:
+                self.saveModified(temp, '{}_{:06d}.{}'.format(
+                    name, number, self.outputFIleType))
             if return_list:
                 modified.append(temp)
 
         return modified
 
 
+def readFrames(videoPath):
+    """Reads the frames of a video file one at a time.
+
+    Parameters
+    ----------
+    videoPath : str
+            The path to a video file readable by cv2.VideoCapture.
+
+    Yields
+    ----------
+    numpy.ndarray
+            A NumPy's array containing a BGR frame.
+    """
+
+    capture = cv2.VideoCapture(videoPath)
+    if not capture.isOpened():
+        raise IOError("Video file could not be opened: " + videoPath)
+    try:
+        success, frame = capture.read()
+        while success:
+            yield frame
+            success, frame = capture.read()
+    finally:
+        capture.release()
+
+
+async def _asyncIterate(inputs):
+    """Iterates asynchronously over an iterable or asynchronous iterable."""
+
+    if hasattr(inputs, '__aiter__'):
+        async for item in inputs:
+            yield item
+    else:
+        for item in inputs:
+            yield item
+
+
 def example():
     img_url = "https://rodolfoferro.xyz/assets/images/dog_original.jpeg"
     wget.download(img_url, out='dog.jpg')
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Progress, metrics and failure accounting of pipeline runs.
+
+@author: Rodolfo Ferro
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+
+class Report(object):
+    """Counts the images of a run, their failures and timings. Updating a
+    report costs a lock and a clock read per image; the progress callback is
+    called at most once per interval.
+
+    Parameters
+    ----------
+    total : int (optional)
+            Number of images expected. By default it is set to 0.
+    callback : callable (optional)
+            A function called with the report to show progress, like
+            printProgress. By default it is set to None.
+    interval : float (optional)
+            Minimum number of seconds between two calls of callback.
+            By default it is set to 1.0.
+    """
+
+    # Name, type and help of the exported metrics.
+    metrics = (
+        ('images', 'gauge', 'Images to be processed.'),
+        ('processed', 'counter', 'Images processed successfully.'),
+        ('failed', 'counter', 'Images that could not be processed.'),
+        ('skipped', 'counter', 'Duplicated images not processed again.'),
+        ('cached', 'counter', 'Images taken from the result cache.'),
+        ('tiled', 'counter', 'Images processed in tiles.'),
+        ('seconds', 'counter', 'Seconds spent processing images.'),
+        ('elapsed', 'gauge', 'Seconds since the start of the run.'),
+        ('rate', 'gauge', 'Images processed per second.')
+    )
+
+    def __init__(self, total=0, callback=None, interval=1.0):
+        self.callback = callback
+        self.interval = interval
+        self.counters = {'images': total, 'processed': 0, 'failed': 0,
+                         'skipped': 0, 'cached': 0, 'tiled': 0,
+                         'seconds': 0.0}
+        self.failures = []
+        self.started = time.time()
+        self.lastCall = 0.0
+        self.lock = threading.Lock()
+        self.callbackLock = threading.Lock()
+
+    def count(self, name, value=1):
+        """Adds value to a counter.
+
+        Parameters
+        ----------
+        name : str
+                Name of the counter, e.g. "skipped" or "cached".
+        value : int (optional)
+                By default it is set to 1.
+        """
+
+        with self.lock:
+            self.counters[name] += value
+        self._progress()
+
+    def succeeded(self, path, seconds):
+        """Records an image processed successfully.
+
+        Parameters
+        ----------
+        path : str
+                The path to the image file.
+        seconds : float
+                Time spent processing the image.
+        """
+
+        with self.lock:
+            self.counters['processed'] += 1
+            self.counters['seconds'] += seconds
+        self._progress()
+
+    def failed(self, path, error):
+        """Records an image that could not be processed.
+
+        Parameters
+        ----------
+        path : str
+                The path to the image file.
+        error : Exception or str
+                The reason of the failure.
+        """
+
+        reason = error if isinstance(error, str) else \
+            '{}: {}'.format(type(error).__name__, error)
+        with self.lock:
+            self.counters['failed'] += 1
+            self.failures.append((path, reason))
+        self._progress()
+
+    def finish(self):
+        """Calls the progress callback a last time."""
+
+        if self.callback is not None:
+            with self.callbackLock:
+                self.callback(self)
+
+    def _progress(self):
+        if self.callback is None:
+            return
+        now = time.time()
+        with self.lock:
+            if now - self.lastCall < self.interval:
+                return
+            self.lastCall = now
+        # A call still running in another thread makes this one skip, so
+        # progress lines never interleave.
+        if self.callbackLock.acquire(False):
+            try:
+                self.callback(self)
+            finally:
+                self.callbackLock.release()
+
+    def __getstate__(self):
+        # Locks cannot be pickled; they are rebuilt by __setstate__.
+        state = dict(vars(self))
+        del state['lock'], state['callbackLock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.callbackLock = threading.Lock()
+
+    def toDict(self):
+        """Returns the counters, the rates and the failures.
+
+        Returns
+        -------
+        dict
+                The counters of Report.metrics and the list "failures" of
+                dicts with the keys "path" and "reason".
+        """
+
+        with self.lock:
+            values = dict(self.counters)
+            failures = list(self.failures)
+        values['elapsed'] = time.time() - self.started
+        values['rate'] = values['processed'] / values['elapsed'] \
+            if values['elapsed'] else 0.0
+        values['failures'] = [{'path': path, 'reason': reason}
+                              for path, reason in failures]
+
+        return values
+
+    def toJSON(self):
+        """Returns the report as a JSON document."""
+
+        return json.dumps(self.toDict(), indent=2)
+
+    def toPrometheus(self, prefix='impipes'):
+        """Returns the counters in the Prometheus text exposition format,
+        e.g. for the textfile collector of node_exporter.
+
+        Parameters
+        ----------
+        prefix : str (optional)
+                Prefix of the metric names. By default it is "impipes".
+
+        Returns
+        -------
+        str
+                The metrics, one per line.
+        """
+
+        values = self.toDict()
+        lines = []
+        for name, kind, description in self.metrics:
+            metric = '{}_{}{}'.format(prefix, name,
+                                      '_total' if kind == 'counter' else '')
+            lines.append('# HELP {} {}'.format(metric, description))
+            lines.append('# TYPE {} {}'.format(metric, kind))
+            lines.append('{} {}'.format(metric, values[name]))
+
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path):
+        """Writes the report to a file, as JSON if path ends with .json and
+        in the Prometheus text format otherwise. The file is replaced
+        atomically, so readers never see a partial report.
+
+        Parameters
+        ----------
+        path : str
+                The path to the file.
+        """
+
+        text = self.toJSON() if path.endswith('.json') else \
+            self.toPrometheus()
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as stream:
+            stream.write(text)
+        os.replace(temporary, path)
+
+
+def printProgress(report):
+    """A progress callback printing one line to stderr.
+
+    Parameters
+    ----------
+    report : Report
+            The report of the run.
+    """
+
+    values = report.toDict()
+    done = values['processed'] + values['failed'] + values['skipped']
+    sys.stderr.write('{}/{} images, {} failed, {:.1f} images/s\n'.format(
+        done, values['images'], values['failed'], values['rate']))
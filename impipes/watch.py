@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Watch-folder service feeding new image files through a Pipeline.
+
+@author: Rodolfo Ferro
+"""
+
+import collections
+import os
+import os.path
+import queue
+import threading
+import time
+from .report import Report
+
+
+class Watcher(object):
+    """Watches folders for new image files and processes them with a warm
+    pipeline as they arrive. Folders are polled; a file is queued once its
+    size and modification time are unchanged between two polls, so files
+    still being written are not picked up. A file replaced under the same
+    name is processed again, and a file that failed is retried once it is
+    stable again, up to retries times.
+
+    Parameters
+    ----------
+    pipeline : pipes.Pipeline
+            A configured pipeline. Its filters, output path, output file
+            type, prefix and sufix are used for every image.
+    folders : list (optional)
+            A list of paths to folders to be watched.
+    workers : int (optional)
+            Number of worker threads. By default it is set to 2. A
+            pipeline with stateful filters (see Pipeline.isStateful()) is
+            given a single worker, so files are processed in arrival order.
+    interval : float (optional)
+            Seconds between two polls of the watched folders.
+            By default it is set to 1.0.
+    queueSize : int (optional)
+            Maximum number of files waiting to be processed. Polling
+            blocks while the queue is full. By default it is set to 64.
+    existing : bool (optional)
+            If True files already present in the folders are processed
+            as well. Default is True.
+    retries : int (optional)
+            Number of times a file that failed is processed again.
+            By default it is set to 2.
+    window : float (optional)
+            Seconds over which the throughput of metrics() is measured.
+            By default it is set to 60.
+    """
+
+    extensions = ('jpg', 'jpeg', 'png', 'tif')
+
+    def __init__(self, pipeline, folders=None, workers=2, interval=1.0,
+                 queueSize=64, existing=True, retries=2, window=60.0):
+        self.pipeline = pipeline
+        self.folders = list(folders or [])
+        self.workers = workers
+        self.interval = interval
+        self.existing = existing
+        self.retries = retries
+        self.window = window
+
+        self.queue = queue.Queue(maxsize=queueSize)
+        # Size and modification time of files already queued, by path.
+        self.seen = {}
+        self.pending = {}
+        self.attempts = {}
+        self.retry = set()
+        self.completed = collections.deque()
+        self.started = None
+        self.threads = []
+        self.stopEvent = threading.Event()
+        self.lock = threading.Lock()
+
+        self.report = Report()
+        self.inFlight = 0
+        self.latency = 0.0
+
+    def addFolder(self, path):
+        """Adds a folder to be watched. Its subfolders are watched as well.
+
+        Parameters
+        ----------
+        path : str
+                The path to a folder like r"~/path/to/image/files"
+        """
+
+        self.folders.append(path)
+
+    def scan(self):
+        """Polls the watched folders once.
+
+        Return
+        ----------
+        list
+                Pairs of path and detection time of files that became
+                stable since the last poll.
+        """
+
+        with self.lock:
+            for path in self.retry:
+                self.seen.pop(path, None)
+            self.retry = set()
+
+        output = os.path.abspath(self.pipeline.outputPath or os.curdir)
+        found = []
+        present = set()
+        for folder in self.folders:
+            for root, dir, files in os.walk(folder):
+                if os.path.abspath(root) == output:
+                    continue
+                for name in files:
+                    extension = name.split('.')[-1]
+                    if extension not in self.extensions:
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    present.add(path)
+                    state = (stat.st_size, stat.st_mtime)
+                    if self.seen.get(path) == state:
+                        continue
+                    previous, detected = self.pending.get(path,
+                                                          (None, time.time()))
+                    if previous == state:
+                        found.append((path, detected))
+                        self.seen[path] = state
+                        del self.pending[path]
+                    else:
+                        self.pending[path] = (state, detected)
+
+        # Forget files that are gone, so the bookkeeping does not grow for
+        # the life of the service.
+        for known in (self.seen, self.pending):
+            for path in [path for path in known if path not in present]:
+                del known[path]
+        with self.lock:
+            for path in [path for path in self.attempts
+                         if path not in present]:
+                del self.attempts[path]
+
+        return found
+
+    def _poll(self):
+        if not self.existing:
+            self.scan()
+            self.scan()
+            for path, (state, detected) in self.pending.items():
+                self.seen[path] = state
+            self.pending = {}
+
+        while not self.stopEvent.is_set():
+            for item in self.scan():
+                while not self.stopEvent.is_set():
+                    try:
+                        self.queue.put(item, timeout=self.interval)
+                        break
+                    except queue.Full:
+                        pass
+            self.stopEvent.wait(self.interval)
+
+    def _work(self):
+        while not self.stopEvent.is_set():
+            try:
+                path, detected = self.queue.get(timeout=self.interval)
+            except queue.Empty:
+                continue
+
+            with self.lock:
+                self.inFlight += 1
+            started = time.time()
+            try:
+                temp = self.pipeline.process(path)
+                self.pipeline.saveModified(temp, os.path.split(path)[1])
+            except Exception as error:
+                self.report.failed(path, error)
+                with self.lock:
+                    self.attempts[path] = self.attempts.get(path, 0) + 1
+                    if self.attempts[path] <= self.retries:
+                        self.retry.add(path)
+            else:
+                self.report.succeeded(path, time.time() - started)
+                with self.lock:
+                    self.attempts.pop(path, None)
+                    self.latency += time.time() - detected
+                    self.completed.append(time.time())
+            finally:
+                with self.lock:
+                    self.inFlight -= 1
+                self.queue.task_done()
+
+    def start(self):
+        """Starts polling the folders and processing new files in the
+        background."""
+
+        self.stopEvent.clear()
+        self.report = Report()
+        self.started = time.time()
+        self.completed.clear()
+        self.threads = [threading.Thread(target=self._poll, daemon=True)]
+        workers = 1 if self.pipeline.isStateful() else self.workers
+        for _ in range(workers):
+            self.threads.append(threading.Thread(target=self._work,
+                                                 daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """Stops the service. Images being processed are finished, queued
+        ones are dropped."""
+
+        self.stopEvent.set()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def serve(self):
+        """Runs the service in the foreground until interrupted."""
+
+        self.start()
+        try:
+            while True:
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def metrics(self):
+        """Reports throughput and queue depth of the service.
+
+        Return
+        ----------
+        dict
+                Counts of processed and failed images, images in the queue
+                and in progress, throughput in images per second over the
+                last window seconds and the average latency in seconds from
+                detection to output.
+                Failures are listed in self.report, which can also export
+                the counters to JSON or Prometheus files.
+        """
+
+        values = self.report.toDict()
+        now = time.time()
+        with self.lock:
+            while self.completed and self.completed[0] < now - self.window:
+                self.completed.popleft()
+            span = min(self.window, now - self.started) \
+                if self.started else 0.0
+            return {
+                'processed': values['processed'],
+                'failed': values['failed'],
+                'queued': self.queue.qsize(),
+                'inFlight': self.inFlight,
+                'pending': len(self.pending),
+                'throughput': len(self.completed) / span if span else 0.0,
+                'latency': self.latency / values['processed']
+                if values['processed'] else 0.0
+            }
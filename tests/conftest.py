@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures of the test suite.
+
+@author: Rodolfo Ferro
+"""
+
+import cv2
+import numpy
+import pytest
+
+
+def makeImage(height=120, width=160, seed=0):
+    """Returns a smooth synthetic BGR image with some texture."""
+
+    random = numpy.random.RandomState(seed)
+    y, x = numpy.mgrid[0:height, 0:width]
+    image = numpy.empty((height, width, 3), numpy.uint8)
+    for channel in range(3):
+        phase = random.uniform(0, 2 * numpy.pi)
+        wave = numpy.sin(x / 17.0 + y / 23.0 * (channel + 1) + phase)
+        noise = random.randint(0, 40, (height, width))
+        image[..., channel] = numpy.clip(100 + 80 * wave + noise, 0, 255)
+
+    return image
+
+
+@pytest.fixture
+def image():
+    return makeImage()
+
+
+@pytest.fixture
+def imageFile(tmp_path, image):
+    path = str(tmp_path / 'input.png')
+    cv2.imwrite(path, image)
+    return path
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the asynchronous Pipeline interface.
+
+@author: Rodolfo Ferro
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+from impipes.filters import Filter, Gamma
+from impipes.pipes import Pipeline
+
+
+class Slow(Filter):
+    """Sleeps longer for darker images and counts concurrent calls."""
+
+    def __init__(self, image=None):
+        super(Slow, self).__init__(image)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def process(self, image, out=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.02 * (10 - int(image[0, 0, 0]) // 10))
+        with self.lock:
+            self.running -= 1
+        return self._store(image + 1, out)
+
+
+def frames(count=8):
+    return [numpy.full((4, 4, 3), 10 * number, numpy.uint8)
+            for number in range(count)]
+
+
+def runAsync(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_aprocess_matches_process(image):
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+
+    result = runAsync(pipeline.aprocess(image))
+    encoded = runAsync(pipeline.aprocess(image, encode=True))
+
+    assert numpy.array_equal(result, pipeline.process(image))
+    assert encoded == pipeline.encode(result)
+
+
+def test_aprocess_respects_concurrency():
+    slow = Slow()
+    pipeline = Pipeline([slow])
+    executor = ThreadPoolExecutor(8)
+    pipeline.setExecutor(executor, concurrency=2)
+
+    async def main():
+        return await asyncio.gather(*[pipeline.aprocess(frame)
+                                      for frame in frames()])
+
+    results = runAsync(main())
+    executor.shutdown()
+
+    assert slow.peak == 2
+    assert [int(result[0, 0, 0]) for result in results] == \
+        [10 * number + 1 for number in range(8)]
+
+
+def test_aiterate_yields_in_input_order():
+    pipeline = Pipeline([Slow()])
+    executor = ThreadPoolExecutor(4)
+    pipeline.setExecutor(executor)
+
+    async def main():
+        return [result async for result in pipeline.aiterate(frames(),
+                                                             limit=4)]
+
+    results = runAsync(main())
+    executor.shutdown()
+
+    assert [int(result[0, 0, 0]) for result in results] == \
+        [10 * number + 1 for number in range(8)]
+
+
+def test_aiterate_applies_backpressure():
+    pipeline = Pipeline([Gamma()])
+    taken = []
+    ahead = []
+
+    async def produce():
+        for frame in frames(10):
+            taken.append(frame)
+            yield frame
+
+    async def main():
+        consumed = 0
+        async for result in pipeline.aiterate(produce(), limit=3):
+            consumed += 1
+            ahead.append(len(taken) - consumed)
+            await asyncio.sleep(0.01)
+        return consumed
+
+    assert runAsync(main()) == 10
+    assert max(ahead) <= 2
+
+
+def test_stateful_pipelines_run_one_image_at_a_time():
+    slow = Slow()
+    slow.stateful = True
+    pipeline = Pipeline([slow])
+    executor = ThreadPoolExecutor(4)
+    pipeline.setExecutor(executor, concurrency=4)
+
+    async def main():
+        results = [result async for result in pipeline.aiterate(frames(),
+                                                                limit=4)]
+        await asyncio.gather(*[pipeline.aprocess(frame)
+                               for frame in frames()])
+        return results
+
+    results = runAsync(main())
+    executor.shutdown()
+
+    assert slow.peak == 1
+    assert [int(result[0, 0, 0]) for result in results] == \
+        [10 * number + 1 for number in range(8)]
+
+
+def test_pipelines_can_be_used_from_several_loops():
+    slow = Slow()
+    pipeline = Pipeline([slow])
+    pipeline.setExecutor(concurrency=1)
+
+    async def main():
+        return await asyncio.gather(*[pipeline.aprocess(frame)
+                                      for frame in frames(4)])
+
+    for _ in range(2):
+        results = runAsync(main())
+        assert [int(result[0, 0, 0]) for result in results] == \
+            [10 * number + 1 for number in range(4)]
+    assert slow.peak == 1
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the impipes command.
+
+@author: Rodolfo Ferro
+"""
+
+import json
+import os
+import cv2
+import pytest
+from impipes import cli
+from .conftest import makeImage
+
+
+def writeSpec(folder, spec, name='spec.json'):
+    path = str(folder / name)
+    with open(path, 'w') as stream:
+        json.dump(spec, stream)
+    return path
+
+
+def test_load_spec_reads_json_and_yaml(tmp_path):
+    spec = {'filters': ['Gamma', {'name': 'Denoise',
+                                  'params': {'strength': 5}}]}
+    path = writeSpec(tmp_path, spec)
+    assert cli.loadSpec(path) == spec
+
+    yaml = pytest.importorskip('yaml')
+    path = str(tmp_path / 'spec.yml')
+    with open(path, 'w') as stream:
+        yaml.safe_dump(spec, stream)
+    assert cli.loadSpec(path) == spec
+
+
+def test_find_inputs_expands_folders_and_patterns(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    for name in ('a.png', 'sub/b.jpg', 'notes.txt'):
+        (tmp_path / name).write_bytes(b'')
+
+    found = cli.findInputs([str(tmp_path), str(tmp_path / '*.png')])
+
+    assert found == [str(tmp_path / 'a.png'), str(tmp_path / 'sub' / 'b.jpg')]
+
+
+def test_main_runs_the_spec(tmp_path):
+    inputs = tmp_path / 'inputs'
+    inputs.mkdir()
+    for seed in range(3):
+        cv2.imwrite(str(inputs / '{}.png'.format(seed)), makeImage(seed=seed))
+    spec = writeSpec(tmp_path, {'filters': [{'name': 'Gamma',
+                                             'params': {'gamma': 1.5}}],
+                                'format': 'png', 'workers': 2})
+    output = str(tmp_path / 'outputs')
+    metrics = str(tmp_path / 'metrics.json')
+
+    cli.main([spec, '-i', str(inputs), '-o', output, '--quiet', '--memory',
+              '64', '--metrics', metrics, '--profile',
+              str(tmp_path / 'profile')])
+
+    assert sorted(os.listdir(output)) == \
+        ['0_modified.png', '1_modified.png', '2_modified.png']
+    with open(metrics) as stream:
+        assert json.load(stream)['processed'] == 3
+    assert os.path.isfile(str(tmp_path / 'profile'))
+
+
+def test_main_exits_with_an_error_on_failures(tmp_path):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    spec = writeSpec(tmp_path, {'filters': ['Gamma']})
+
+    with pytest.raises(SystemExit) as error:
+        cli.main([spec, '-i', str(broken), '-o', str(tmp_path / 'out'),
+                  '--quiet'])
+
+    assert error.value.code == 1
+
+
+def test_main_accepts_a_single_input_pattern(tmp_path):
+    cv2.imwrite(str(tmp_path / 'a.png'), makeImage())
+    spec = writeSpec(tmp_path, {'filters': ['Gamma'],
+                                'inputs': str(tmp_path / '*.png'),
+                                'output': str(tmp_path / 'out')})
+
+    cli.main([spec, '--quiet'])
+
+    assert os.listdir(str(tmp_path / 'out')) == ['a_modified.jpg']
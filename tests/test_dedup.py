@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of duplicate and near-duplicate detection.
+
+@author: Rodolfo Ferro
+"""
+
+import shutil
+import cv2
+from impipes.dedup import findDuplicates, hammingDistance, perceptualHash
+from impipes.pipes import Pipeline
+from impipes.filters import Gamma
+from .conftest import makeImage
+
+
+def writeImages(folder):
+    first = str(folder / 'first.png')
+    copy = str(folder / 'copy.png')
+    other = str(folder / 'other.png')
+    cv2.imwrite(first, makeImage(seed=1))
+    shutil.copy(first, copy)
+    cv2.imwrite(other, makeImage(seed=2))
+    return first, copy, other
+
+
+def test_exact_duplicates_are_grouped(tmp_path):
+    first, copy, other = writeImages(tmp_path)
+
+    groups = findDuplicates([first, other, copy])
+
+    assert groups == [[first, copy], [other]]
+
+
+def test_missing_files_get_their_own_group(tmp_path):
+    first, copy, other = writeImages(tmp_path)
+    missing = str(tmp_path / 'missing.png')
+
+    groups = findDuplicates([missing, first, missing + '2', copy])
+
+    assert groups == [[missing], [first, copy], [missing + '2']]
+
+
+def test_reencoded_copies_are_grouped_when_perceptual(tmp_path):
+    first, copy, other = writeImages(tmp_path)
+    reencoded = str(tmp_path / 'reencoded.jpg')
+    cv2.imwrite(reencoded, cv2.imread(first),
+                [cv2.IMWRITE_JPEG_QUALITY, 80])
+
+    assert findDuplicates([first, reencoded]) == [[first], [reencoded]]
+    assert findDuplicates([first, other, reencoded], perceptual=True) == \
+        [[first, reencoded], [other]]
+
+
+def test_perceptual_grouping_matches_pairwise_comparison(tmp_path):
+    paths = []
+    for seed in range(12):
+        path = str(tmp_path / '{}.png'.format(seed))
+        cv2.imwrite(path, makeImage(seed=seed % 4))
+        cv2.imwrite(path, cv2.GaussianBlur(cv2.imread(path), (3, 3),
+                                           seed / 4.0 + 0.1))
+        paths.append(path)
+
+    for maxDistance in (0, 4, 10):
+        expected = []
+        hashes = []
+        for path in paths:
+            value = perceptualHash(path)
+            for index, other in enumerate(hashes):
+                if hammingDistance(value, other) <= maxDistance:
+                    expected[index].append(path)
+                    break
+            else:
+                expected.append([path])
+                hashes.append(value)
+
+        assert findDuplicates(paths, perceptual=True,
+                              maxDistance=maxDistance) == expected
+
+
+def test_run_processes_duplicates_once(tmp_path):
+    first, copy, other = writeImages(tmp_path)
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    pipeline.setOutputPath(str(tmp_path))
+    pipeline.setOutputFileType('png')
+    pipeline.setDeduplicate()
+    for path in (first, copy, other):
+        pipeline.addImage(path)
+
+    results = pipeline.run(return_list=True)
+
+    assert pipeline.dedupReport['processed'] == 2
+    assert pipeline.report.counters['skipped'] == 1
+    assert results[0] is results[1]
+    assert (tmp_path / 'copy_modified.png').is_file()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the filters.
+
+@author: Rodolfo Ferro
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy
+import pytest
+from impipes import filters
+from .conftest import makeImage
+
+FILTERS = [filters.Gamma, filters.Kernel, filters.Sharpen, filters.Excessive,
+           filters.EdgeEnhance, filters.Denoise, filters.Dehaze,
+           filters.Unsharp, filters.CLAHE]
+
+
+@pytest.mark.parametrize('filterClass', FILTERS)
+def test_process_matches_run(filterClass, image):
+    expected = filterClass(image=image).run()
+
+    item = filterClass()
+    before = dict(vars(item))
+    result = item.process(image)
+
+    assert numpy.array_equal(result, expected)
+    assert numpy.array_equal(item(image), expected)
+    assert vars(item).keys() == before.keys()
+    assert item.filteredImage is None
+
+
+@pytest.mark.parametrize('filterClass', FILTERS)
+def test_process_writes_into_out(filterClass, image):
+    item = filterClass()
+    expected = item.process(image)
+    out = numpy.zeros_like(expected)
+
+    assert item.process(image, out=out) is out
+    assert numpy.array_equal(out, expected)
+
+
+def test_filters_can_be_shared_between_threads():
+    images = [makeImage(seed=seed) for seed in range(8)]
+    chain = [filters.Dehaze(), filters.Gamma(gamma=1.4), filters.CLAHE()]
+
+    def apply(image):
+        for item in chain:
+            image = item.process(image)
+        return image
+
+    expected = [apply(image) for image in images]
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(apply, images))
+
+    for result, reference in zip(results, expected):
+        assert numpy.array_equal(result, reference)
+
+
+def test_dehaze_estimates_at_full_resolution_by_default(image):
+    expected = filters.Dehaze().process(image)
+
+    larger = filters.Dehaze(estimate_size=max(image.shape))
+    assert numpy.array_equal(larger.process(image), expected)
+    assert filters.Dehaze().measureError(image) == \
+        {'mean': 0.0, 'max': 0, 'p99': 0.0}
+
+
+@pytest.mark.parametrize('estimate_size', [128, 256, 400])
+def test_dehaze_low_resolution_error_is_bounded(estimate_size):
+    image = makeImage(480, 640)
+
+    error = filters.Dehaze(estimate_size=estimate_size).measureError(image)
+
+    assert 0 < error['mean'] < 3
+    assert error['p99'] < 30
+
+
+def countEstimates(item):
+    calls = []
+    estimate = item._get_atmospheric_light
+
+    def counted(img, dark):
+        calls.append(1)
+        return estimate(img, dark)
+
+    item._get_atmospheric_light = counted
+    return calls
+
+
+def test_dehaze_sequence_reuses_atmospheric_light(image):
+    item = filters.Dehaze(sequence=True, refresh=5)
+    calls = countEstimates(item)
+
+    for _ in range(12):
+        item.process(image)
+    assert len(calls) == 3
+
+    item.process(255 - image)
+    assert len(calls) == 4
+
+    item.reset()
+    item.process(image)
+    assert len(calls) == 5
+
+
+def test_dehaze_sequence_first_frame_matches_single_image(image):
+    item = filters.Dehaze(sequence=True)
+
+    assert numpy.array_equal(item.process(image),
+                             filters.Dehaze().process(image))
+    assert item.stateful
+    assert not filters.Dehaze().stateful
+
+
+def test_dehaze_sequence_starts_afresh_after_a_scene_cut():
+    dark = (makeImage(seed=1) * 0.3).astype(numpy.uint8)
+    hazy = (makeImage(seed=2) * 0.4 + 150).astype(numpy.uint8)
+    item = filters.Dehaze(sequence=True)
+
+    for _ in range(3):
+        item.process(dark)
+    expected = filters.Dehaze().process(hazy)
+
+    for _ in range(3):
+        assert numpy.array_equal(item.process(hazy), expected)
@@ -10,4 +10,4 @@ from impipes import __version__
 
 
 def test_version():
-    assert __version__ = '0.1.8'
+    assert __version__ == '0.1.8'
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of memory estimation and admission control.
+
+@author: Rodolfo Ferro
+"""
+
+import threading
+import time
+import cv2
+import pytest
+from impipes.filters import CLAHE, Dehaze, Gamma
+from impipes.memory import MemoryBudget, imageShape
+from impipes.pipes import Pipeline
+from .conftest import makeImage
+
+
+@pytest.mark.parametrize('extension', ['png', 'jpg', 'tif', 'bmp'])
+def test_image_shape_reads_headers(tmp_path, extension):
+    path = str(tmp_path / ('image.' + extension))
+    cv2.imwrite(path, makeImage(96, 200))
+
+    assert imageShape(path) == (96, 200)
+
+
+def test_image_shape_of_unreadable_files(tmp_path):
+    broken = tmp_path / 'broken.jpg'
+    broken.write_bytes(b'\xff\xd8\xff')
+
+    assert imageShape(str(broken)) is None
+    assert imageShape(str(tmp_path / 'missing.png')) is None
+
+
+def test_budget_admits_work_that_fits():
+    budget = MemoryBudget(100)
+    first = budget.acquire(60)
+    admitted = []
+    waiting = threading.Thread(target=lambda: admitted.append(
+        budget.acquire(60)))
+    waiting.start()
+
+    time.sleep(0.1)
+    assert admitted == []
+    budget.release(first)
+    waiting.join(1)
+
+    assert admitted == [60]
+    assert budget.peak == 60
+
+
+def test_oversized_requests_wait_for_the_whole_budget():
+    budget = MemoryBudget(100)
+
+    assert budget.acquire(500) == 100
+    assert budget.used == 100
+
+
+def test_estimate_grows_with_the_working_set():
+    shape = (1000, 1000)
+
+    assert Pipeline([Gamma()]).estimateMemory(shape) == 6000000
+    assert Pipeline([Dehaze()]).estimateMemory(shape) == 132000000
+    assert Pipeline([Dehaze()]).estimateMemory(shape, 256) < 132000000
+
+
+def test_dehaze_working_set_follows_the_image_size():
+    item = Dehaze(estimate_size=512)
+
+    assert item.workingSetFor((300, 400)) == Dehaze().workingSetFor((1, 1))
+    assert item.workingSetFor((1000, 800)) < item.workingSetFor((300, 400))
+    assert Pipeline([item]).estimateMemory((300, 400)) == \
+        Pipeline([Dehaze()]).estimateMemory((300, 400))
+
+
+def test_run_tiles_images_larger_than_the_budget(tmp_path):
+    path = str(tmp_path / 'large.png')
+    cv2.imwrite(path, makeImage(400, 400))
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    pipeline.addImage(path)
+    expected = pipeline.process(path)
+    pipeline.setMemoryBudget(pipeline.estimateMemory(path) // 2)
+
+    result = pipeline.run(save_files=False, return_list=True)[0]
+
+    assert (result == expected).all()
+    assert pipeline.memoryReport['tiled'] == [path]
+    assert pipeline.memoryReport['peak'] <= pipeline.memoryBudget
+
+
+@pytest.mark.parametrize('item', [CLAHE(), Dehaze(),
+                                  Dehaze(estimate_size=128)])
+def test_run_does_not_tile_whole_image_filters(tmp_path, item):
+    pipeline = Pipeline([Gamma(gamma=1.5), item])
+    pipeline.setWorkers(2)
+    for seed in range(2):
+        path = str(tmp_path / '{}.png'.format(seed))
+        cv2.imwrite(path, makeImage(300, 400, seed=seed))
+        pipeline.addImage(path)
+    expected = [pipeline.process(path) for path in pipeline.images]
+    pipeline.setMemoryBudget(pipeline.estimateMemory(path) // 2)
+
+    results = pipeline.run(save_files=False, return_list=True)
+
+    assert not pipeline.isTileable()
+    for result, reference in zip(results, expected):
+        assert (result == reference).all()
+    assert pipeline.memoryReport['tiled'] == []
+    assert pipeline.memoryReport['peak'] == pipeline.memoryBudget
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the Pipeline class.
+
+@author: Rodolfo Ferro
+"""
+
+import io
+import json
+import os
+import pickle
+import warnings
+import cv2
+import numpy
+import pytest
+from impipes.filters import CLAHE, Dehaze, Denoise, Filter, Gamma, Kernel
+from impipes.pipes import Pipeline
+from .conftest import makeImage
+
+
+def makePipeline():
+    pipeline = Pipeline([Gamma(gamma=1.8),
+                         Kernel(kernel=[[0, 1, 0], [1, 4, 1], [0, 1, 0]]),
+                         Denoise(strength=5)])
+    pipeline.setOutputFileType('png')
+    pipeline.setOutputQuality(compression=5)
+    pipeline.setWorkers(3)
+    pipeline.setTiling(256, 16)
+    pipeline.setMemoryBudget(100 * 2 ** 20)
+    return pipeline
+
+
+def test_spec_round_trip():
+    pipeline = makePipeline()
+    spec = pipeline.toSpec()
+
+    copy = Pipeline.fromSpec(json.loads(json.dumps(spec)))
+
+    assert copy.toSpec() == spec
+    assert [type(item) for item in copy.pipeline] == [Gamma, Kernel, Denoise]
+    assert copy.fingerprint() == pipeline.fingerprint()
+
+
+def test_memory_budget_is_given_in_mb():
+    pipeline = Pipeline.fromSpec({'filters': ['Gamma'], 'memory': 1.5})
+
+    assert pipeline.memoryBudget == 3 * 2 ** 19
+    assert pipeline.toSpec()['memory'] == 1.5
+
+
+def test_dehaze_parameters_round_trip():
+    item = Dehaze(strength=12, estimate_size=256, sequence=True,
+                  change_threshold=4.0)
+
+    spec = item.toSpec()
+    copy = Filter.fromSpec(json.loads(json.dumps(spec)))
+
+    assert spec['params'] == {'strength': 12, 'estimate_size': 256,
+                              'sequence': True, 'refresh': 30,
+                              'smoothing': 0.5, 'change_threshold': 4.0}
+    assert copy.toSpec() == spec
+
+
+def test_filters_may_be_given_by_name():
+    pipeline = Pipeline.fromSpec({'filters': ['Dehaze', 'Gamma']})
+
+    assert pipeline.toSpec()['filters'][1] == \
+        {'name': 'Gamma', 'params': {'gamma': 1.0}}
+    with pytest.raises(ValueError):
+        Filter.fromSpec('Pipeline')
+
+
+def test_fingerprint_depends_on_filters_only():
+    pipeline = makePipeline()
+    other = makePipeline()
+    other.setPrefix('other_')
+    other.setWorkers(1)
+    assert other.fingerprint() == pipeline.fingerprint()
+
+    other.pipeline[0] = Gamma(gamma=1.9)
+    assert other.fingerprint() != pipeline.fingerprint()
+
+    swapped = makePipeline()
+    swapped.pipeline.reverse()
+    assert swapped.fingerprint() != pipeline.fingerprint()
+
+
+def test_fingerprint_accepts_numpy_parameters():
+    kernel = numpy.ones((3, 3))
+
+    assert Pipeline([Kernel(kernel=kernel)]).fingerprint() == \
+        Pipeline([Kernel(kernel=kernel.tolist())]).fingerprint()
+
+
+def test_pipelines_can_be_pickled(image):
+    pipeline = makePipeline()
+    pipeline.add(Dehaze(image=image))
+    pipeline.run(save_files=False)
+
+    copy = pickle.loads(pickle.dumps(pipeline))
+
+    assert copy.fingerprint() == pipeline.fingerprint()
+    assert copy.pipeline[-1].image is None
+
+
+def test_process_matches_run_with_workers(tmp_path):
+    pipeline = makePipeline()
+    pipeline.setTiling(0)
+    pipeline.setOutputPath(str(tmp_path))
+    for seed in range(6):
+        path = str(tmp_path / '{}.png'.format(seed))
+        cv2.imwrite(path, makeImage(seed=seed))
+        pipeline.addImage(path)
+
+    results = pipeline.run(return_list=True)
+
+    for path, result in zip(pipeline.images, results):
+        assert numpy.array_equal(result, pipeline.process(path))
+        saved = cv2.imread(path.replace('.png', '_modified.png'))
+        assert numpy.array_equal(saved, result)
+
+
+def test_process_accepts_bytes_and_files(image, imageFile):
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    expected = pipeline.process(imageFile)
+    with open(imageFile, 'rb') as stream:
+        data = stream.read()
+
+    for source in (data, bytearray(data), memoryview(data), io.BytesIO(data)):
+        assert numpy.array_equal(pipeline.process(source), expected)
+    with open(imageFile, 'rb') as stream:
+        assert numpy.array_equal(pipeline.process(stream), expected)
+
+
+def test_unreadable_inputs_raise_ioerror(tmp_path):
+    pipeline = Pipeline([Gamma()])
+
+    with pytest.raises(IOError):
+        pipeline.process(b'not an image')
+    with pytest.raises(IOError):
+        pipeline.process(str(tmp_path / 'missing.png'))
+
+
+def test_encode_and_sink_round_trip(image):
+    pipeline = Pipeline([Gamma()])
+    pipeline.setOutputFileType('png')
+
+    data = pipeline.encode(image)
+    sink = io.BytesIO()
+    pipeline.saveModified(image, sink=sink)
+
+    assert isinstance(data, bytes)
+    assert sink.getvalue() == data
+    assert numpy.array_equal(pipeline.process(data), image)
+
+
+def test_save_modified_needs_a_file_name_or_a_sink(image):
+    with pytest.raises(ValueError):
+        Pipeline([Gamma()]).saveModified(image)
+
+
+def test_encode_uses_the_output_quality(image):
+    pipeline = Pipeline([Gamma()])
+    pipeline.setOutputQuality(quality=20)
+    low = pipeline.encode(image)
+    pipeline.setOutputQuality(quality=95)
+
+    assert len(low) < len(pipeline.encode(image))
+    assert pipeline.encode(image, 'png')[:4] == b'\x89PNG'
+
+
+def test_stateful_pipelines_process_in_order(tmp_path):
+    paths = []
+    for seed in range(6):
+        path = str(tmp_path / '{}.png'.format(seed))
+        cv2.imwrite(path, makeImage(seed=seed % 2))
+        paths.append(path)
+
+    def runWith(workers, tileSize):
+        pipeline = Pipeline([Dehaze(sequence=True, change_threshold=1000)])
+        pipeline.setWorkers(workers)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            pipeline.setTiling(tileSize)
+        for path in paths:
+            pipeline.addImage(path)
+        return pipeline, pipeline.run(save_files=False, return_list=True)
+
+    pipeline, expected = runWith(1, 0)
+    assert pipeline.isStateful()
+    item = Dehaze(sequence=True, change_threshold=1000)
+    for path, result in zip(paths, expected):
+        assert numpy.array_equal(item.process(cv2.imread(path)), result)
+
+    for workers, tileSize in ((4, 0), (1, 64), (4, 64)):
+        results = runWith(workers, tileSize)[1]
+        for result, reference in zip(results, expected):
+            assert numpy.array_equal(result, reference)
+
+
+@pytest.mark.parametrize('item', [CLAHE(), Dehaze()])
+def test_whole_image_filters_are_not_tiled(image, item):
+    pipeline = Pipeline([item])
+    expected = pipeline.process(image)
+
+    with pytest.warns(UserWarning):
+        pipeline.setTiling(64, 8)
+
+    assert numpy.array_equal(pipeline.process(image), expected)
+
+
+def test_local_filters_are_tiled_without_seams(image):
+    pipeline = Pipeline([Gamma(gamma=1.5), Kernel()])
+    expected = pipeline.process(image)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        pipeline.setTiling(64, 8)
+
+    assert numpy.array_equal(pipeline.process(image), expected)
+
+
+def addImages(pipeline, folder, count):
+    for seed in range(count):
+        path = str(folder / '{}.png'.format(seed))
+        cv2.imwrite(path, makeImage(seed=seed))
+        pipeline.addImage(path)
+
+
+def test_cache_reuses_results(tmp_path):
+    cache = tmp_path / 'cache'
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    pipeline.setWorkers(2)
+    pipeline.setCache(str(cache))
+    addImages(pipeline, tmp_path, 3)
+
+    first = pipeline.run(save_files=False, return_list=True)
+    second = pipeline.run(save_files=False, return_list=True)
+
+    assert pipeline.report.counters['cached'] == 3
+    assert len(os.listdir(str(cache))) == 3
+    for result, reference in zip(second, first):
+        assert numpy.array_equal(result, reference)
+
+
+def test_failed_cache_writes_are_reported(tmp_path, monkeypatch):
+    cache = tmp_path / 'cache'
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    pipeline.setCache(str(cache))
+    addImages(pipeline, tmp_path, 1)
+    monkeypatch.setattr(cv2, 'imwrite', lambda *args: False)
+
+    pipeline.run(save_files=False)
+
+    assert pipeline.report.counters['failed'] == 1
+    assert 'Cache file could not be written' in \
+        pipeline.report.failures[0][1]
+    assert os.listdir(str(cache)) == []
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of run reports.
+
+@author: Rodolfo Ferro
+"""
+
+import json
+import pickle
+import threading
+import cv2
+from impipes.filters import Gamma
+from impipes.pipes import Pipeline
+from impipes.report import Report
+
+
+def makeReport():
+    report = Report(4)
+    report.succeeded('a.jpg', 0.5)
+    report.succeeded('b.jpg', 0.25)
+    report.count('skipped')
+    report.failed('c.jpg', IOError('Image file could not be read'))
+    return report
+
+
+def test_json_export():
+    values = json.loads(makeReport().toJSON())
+
+    assert values['images'] == 4
+    assert values['processed'] == 2
+    assert values['skipped'] == 1
+    assert values['seconds'] == 0.75
+    assert values['failures'] == [{'path': 'c.jpg', 'reason':
+                                   'OSError: Image file could not be read'}]
+
+
+def test_prometheus_export():
+    lines = makeReport().toPrometheus().splitlines()
+
+    assert '# TYPE impipes_processed_total counter' in lines
+    assert 'impipes_processed_total 2' in lines
+    assert 'impipes_failed_total 1' in lines
+    assert 'impipes_images 4' in lines
+    assert len(lines) == 3 * len(Report.metrics)
+
+
+def test_save_chooses_the_format(tmp_path):
+    report = makeReport()
+    report.save(str(tmp_path / 'metrics.json'))
+    report.save(str(tmp_path / 'metrics.prom'))
+
+    with open(str(tmp_path / 'metrics.json')) as stream:
+        assert json.load(stream)['failed'] == 1
+    with open(str(tmp_path / 'metrics.prom')) as stream:
+        assert stream.read().startswith('# HELP impipes_images ')
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ['metrics.json', 'metrics.prom']
+
+
+def test_reports_can_be_pickled():
+    copy = pickle.loads(pickle.dumps(makeReport()))
+
+    copy.succeeded('d.jpg', 0.1)
+    assert copy.toDict()['processed'] == 3
+
+
+def test_progress_is_throttled_and_not_interleaved():
+    calls = []
+    inside = []
+    overlaps = []
+
+    def callback(report):
+        inside.append(1)
+        overlaps.append(len(inside))
+        calls.append(report.toDict()['processed'])
+        inside.pop()
+
+    report = Report(400, callback, interval=0.0)
+    threads = [threading.Thread(target=lambda: [report.succeeded('x', 0)
+                                                for _ in range(100)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report.finish()
+    assert calls[-1] == 400
+    assert max(overlaps) == 1
+
+    calls[:] = []
+    throttled = Report(10, callback, interval=60.0)
+    for _ in range(10):
+        throttled.succeeded('x', 0)
+    assert len(calls) == 1
+
+
+def test_run_records_failures(tmp_path, imageFile):
+    pipeline = Pipeline([Gamma()])
+    pipeline.setOutputPath(str(tmp_path / 'out'))
+    pipeline.addImage(imageFile)
+    pipeline.addImage(str(tmp_path / 'missing.png'))
+    progress = []
+    pipeline.setProgress(progress.append, interval=0.0)
+
+    results = pipeline.run(return_list=True)
+
+    assert results[1] is None
+    assert pipeline.report.counters['processed'] == 1
+    assert [path for path, reason in pipeline.report.failures] == \
+        [str(tmp_path / 'missing.png')]
+    assert progress[-1] is pipeline.report
+    assert cv2.imread(str(tmp_path / 'out' / 'input_modified.jpg')) \
+        is not None
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the watch-folder service.
+
+@author: Rodolfo Ferro
+"""
+
+import os
+import time
+import cv2
+from impipes.filters import Dehaze, Gamma
+from impipes.pipes import Pipeline
+from impipes.watch import Watcher
+from .conftest import makeImage
+
+
+def makeWatcher(tmp_path, **options):
+    inbox = tmp_path / 'inbox'
+    inbox.mkdir()
+    pipeline = Pipeline([Gamma(gamma=1.5)])
+    pipeline.setOutputPath(str(tmp_path / 'outbox'))
+    pipeline.setOutputFileType('png')
+    return Watcher(pipeline, [str(inbox)], **options), inbox
+
+
+def touch(path, delay):
+    stamp = time.time() + delay
+    os.utime(path, (stamp, stamp))
+
+
+def test_files_are_queued_once_stable(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path)
+    path = str(inbox / 'a.png')
+    cv2.imwrite(path, makeImage())
+
+    assert watcher.scan() == []
+    found = watcher.scan()
+    assert [item[0] for item in found] == [path]
+    assert watcher.scan() == []
+
+
+def test_replaced_files_are_queued_again(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path)
+    path = str(inbox / 'a.png')
+    cv2.imwrite(path, makeImage())
+    watcher.scan()
+    watcher.scan()
+
+    cv2.imwrite(path, makeImage(seed=1))
+    touch(path, 10)
+    watcher.scan()
+
+    assert [item[0] for item in watcher.scan()] == [path]
+
+
+def test_deleted_files_are_forgotten(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path)
+    path = str(inbox / 'a.png')
+    cv2.imwrite(path, makeImage())
+    watcher.scan()
+    watcher.scan()
+    assert path in watcher.seen
+
+    os.remove(path)
+    watcher.scan()
+
+    assert watcher.seen == {}
+    assert watcher.pending == {}
+
+
+def test_failed_files_are_retried(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path, interval=0.05, retries=1)
+    path = str(inbox / 'broken.png')
+    with open(path, 'wb') as stream:
+        stream.write(b'not an image')
+
+    watcher.start()
+    try:
+        deadline = time.time() + 5
+        while watcher.metrics()['failed'] < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.3)
+        assert watcher.metrics()['failed'] == 2
+
+        cv2.imwrite(path, makeImage())
+        touch(path, 10)
+        while not watcher.metrics()['processed'] and time.time() < deadline:
+            time.sleep(0.05)
+        metrics = watcher.metrics()
+    finally:
+        watcher.stop()
+
+    assert metrics['processed'] == 1
+    assert metrics['throughput'] > 0
+    assert (tmp_path / 'outbox' / 'broken_modified.png').is_file()
+
+
+def test_throughput_covers_the_recent_window(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path, window=10.0)
+    watcher.started = time.time() - 100
+    watcher.completed.extend([time.time() - 50, time.time() - 1,
+                              time.time() - 2])
+
+    assert watcher.metrics()['throughput'] == 0.2
+    assert len(watcher.completed) == 2
+
+
+def test_stateful_pipelines_get_one_worker(tmp_path):
+    watcher, inbox = makeWatcher(tmp_path, workers=4)
+    watcher.pipeline.add(Dehaze(sequence=True))
+
+    watcher.start()
+    workers = len(watcher.threads) - 1
+    watcher.stop()
+
+    assert workers == 1